@@ -6,38 +6,93 @@ Usage:
 """
 
 import argparse
+import asyncio
+import codecs
 import os
 import sys
 import time
-import csv
+import hashlib
+import itertools
 import logging
+import re
+import shutil
+import sqlite3
 import subprocess
-from urllib.parse import urljoin, urldefrag, urlparse
+from urllib.parse import urlparse, urlunparse
+from email.message import Message
 from collections import deque
-import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import AsyncExitStack
+import httpx
+from pybloom_live import ScalableBloomFilter
+import lxml.etree
+import lxml.html
+import orjson
+import stem
+import stem.connection
+from stem import Signal
+from stem.control import Controller
 import urllib.robotparser
 from tqdm import tqdm
-from requests.exceptions import RequestException
 
 # --- Default constants ---
-TOR_PROXY = "socks5h://127.0.0.1:9050"
+TOR_PROXY = "socks5h://127.0.0.1:{port}"
+DEFAULT_TOR_PORTS = [9050]
+DEFAULT_CONTROL_PORT = 9051
+TOR_START_POLLS = 10
+CHECKPOINT_EVERY = 50
 DEFAULT_USER_AGENT = "ShadowCrawler/1.0 (+https://example.local)"
 DEFAULT_DELAY = 2
 DEFAULT_MAX_PAGES = 200
+DEFAULT_CONCURRENCY = 20
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024
 DEFAULT_OUTPUT_DIR = "tor_output"
+MAX_RETRIES = 2
+MAX_REDIRECTS = 10
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = frozenset((502, 503, 504))
+RECENT_URLS = 4096
+LOG_BUFFER_SIZE = 1 << 16
+LOG_ROLL_SIZE = 100 * 1024 * 1024
+STREAM_CHUNK_SIZE = 1 << 16
+SIMHASH_DISTANCE = 2
+SLOW_RESPONSE = 10
+NEWNYM_INTERVAL = 10
+NON_HTML_EXTENSIONS = frozenset((
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".ico", ".bmp",
+    ".pdf", ".zip", ".gz", ".tar", ".rar", ".7z", ".exe", ".iso",
+    ".mp3", ".mp4", ".avi", ".mkv", ".mov", ".webm",
+    ".css", ".js", ".woff", ".woff2", ".ttf",
+))
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+# --- URL canonicalization patterns ---
+_TRACKER_RE = re.compile(r"^(utm_|fbclid|gclid)")
+_SLASHES_RE = re.compile(r"/{2,}")
+_WORD_RE = re.compile(r"\w+")
+_SKIP_RE = re.compile(r"\.(?:%s)$" % "|".join(sorted(e.lstrip(".") for e in NON_HTML_EXTENSIONS)),
+                      re.IGNORECASE)
+_OK_SCHEMES = frozenset(("http", "https"))
+ROBOTS_TTL = 6 * 3600
+ROBOTS_FAIL_TTL = 300
+
+# --- robots.txt cache: host -> (parser or None, fetched_at) ---
+_robots_cache: dict = {}
+
+# --- Single thread that performs all page writes, in order ---
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-writer")
 
 # --- Logging setup ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("stem").setLevel(logging.WARNING)
 
 
 # === TOR CHECK FUNCTIONS ===
 
 def check_tor_installed() -> bool:
     """Check if Tor binary is installed on system."""
-    result = subprocess.call("which tor", shell=True,
-                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    if result == 0:
+    if shutil.which("tor") is not None:
         logging.info("[+] Tor is installed.")
         return True
     logging.error("[-] Tor is not installed. Please install it: sudo apt install tor")
@@ -63,22 +118,98 @@ def check_tor_service() -> bool:
 def start_tor_service():
     """Try to start the Tor service if not running."""
     logging.info("[*] Attempting to start Tor service...")
-    os.system("sudo systemctl start tor")
-    time.sleep(3)
+    try:
+        subprocess.run(["sudo", "systemctl", "start", "tor"], check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        sys.exit(f"[-] Failed to start Tor service ({e}). Please start it manually.")
+    # Poll with backoff instead of a fixed sleep (~0.3 s on a fast start)
+    for i in range(TOR_START_POLLS):
+        if subprocess.run(["systemctl", "is-active", "--quiet", "tor"]).returncode == 0:
+            break
+        time.sleep(0.3 * (i + 1))
     if not check_tor_service():
         sys.exit("[-] Failed to start Tor service. Please start it manually.")
 
 
+# === TOR Circuit Control ===
+
+class CircuitRotator:
+    """Ask Tor for fresh circuits (SIGNAL NEWNYM), at most once per NEWNYM_INTERVAL."""
+
+    def __init__(self, control_port: int = DEFAULT_CONTROL_PORT):
+        self.control_port = control_port
+        self.last = None
+        self.disabled = False
+
+    def _signal(self):
+        with Controller.from_port(port=self.control_port) as controller:
+            controller.authenticate()
+            controller.signal(Signal.NEWNYM)
+
+    async def renew(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self.disabled or (self.last is not None and now - self.last < NEWNYM_INTERVAL):
+            return
+        self.last = now
+        try:
+            await loop.run_in_executor(None, self._signal)
+            logging.info("[*] Requested new Tor circuit (NEWNYM).")
+        except stem.connection.AuthenticationFailure as e:
+            # Won't fix itself (missing password, unreadable cookie): stop retrying
+            self.disabled = True
+            logging.warning(f"[-] Cannot authenticate to ControlPort {self.control_port}, "
+                            f"disabling circuit rotation for it: {e}")
+        except (stem.SocketError, stem.ControllerError) as e:
+            logging.warning(f"[-] Could not rotate Tor circuit on ControlPort {self.control_port}: {e}")
+
+
 # === Helper Functions ===
 
-def normalize_url(url: str) -> str:
-    """Normalize URL by removing fragments and enforcing scheme."""
-    url, _ = urldefrag(url)
-    parsed = urlparse(url)
-    scheme = parsed.scheme or "http"
-    netloc = parsed.netloc
-    path = parsed.path or "/"
-    return f"{scheme}://{netloc}{path}"
+def normalize_url(url: str, parsed=None) -> str:
+    """Canonicalize URL: lowercase host, drop default port/fragment/trackers, sort query.
+
+    Pass an already-parsed `parsed` (urlparse result) to skip re-parsing.
+    """
+    if parsed is None:
+        url = url.strip()
+        parsed = urlparse(url)
+    if not parsed.scheme and not parsed.netloc:
+        parsed = urlparse("http://" + url)
+    scheme = parsed.scheme.lower() or "http"
+    host = parsed.netloc.lower()
+    default_port = DEFAULT_PORTS.get(scheme)
+    if default_port and host.endswith(default_port):
+        host = host[:-len(default_port)]
+    path = _SLASHES_RE.sub("/", parsed.path) or "/"
+    # Reorder/filter the raw key[=value] segments; never decode and re-encode them
+    params = sorted(seg for seg in parsed.query.split("&")
+                    if seg and not _TRACKER_RE.match(seg.partition("=")[0]))
+    return urlunparse((scheme, host, path, parsed.params, "&".join(params), ""))
+
+
+def in_scope(host: str, domain: str) -> bool:
+    """True if `host` is `domain` or one of its subdomains."""
+    return host == domain or host.endswith("." + domain)
+
+
+def filter_in_scope(links, domain: str) -> list:
+    """Keep in-scope links, deciding each distinct host only once per batch."""
+    scope = {}
+    kept = []
+    for link in links:
+        host = link.split("/", 3)[2]  # links are normalize_url output: scheme://host/...
+        ok = scope.get(host)
+        if ok is None:
+            ok = scope[host] = in_scope(host, domain)
+        if ok:
+            kept.append(link)
+    return kept
+
+
+def looks_like_html(url: str) -> bool:
+    """Cheap URL sniff: False for paths with an obviously non-HTML extension."""
+    return not _SKIP_RE.search(urlparse(url).path)
 
 
 def get_domain(url: str) -> str:
@@ -86,17 +217,34 @@ def get_domain(url: str) -> str:
     return urlparse(url).netloc.lower()
 
 
-def load_robots_txt(url: str):
-    """Load robots.txt for the given URL's domain."""
+async def get_rp(client: httpx.AsyncClient, url: str):
+    """Return the cached robots.txt parser for the URL's host, fetching it if stale."""
     parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    now = time.time()
+    cached = _robots_cache.get(host)
+    if cached is not None:
+        rp, fetched_at = cached
+        ttl = ROBOTS_TTL if rp is not None else ROBOTS_FAIL_TTL
+        if now - fetched_at < ttl:
+            return rp
+
     robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
-    rp = urllib.robotparser.RobotFileParser()
+    rp = urllib.robotparser.RobotFileParser(robots_url)
     try:
-        rp.set_url(robots_url)
-        rp.read()
-        return rp
-    except Exception:
-        return None
+        resp = await client.get(robots_url, follow_redirects=True)
+        if resp.is_success:
+            rp.parse(resp.text.splitlines())
+        elif resp.status_code in (401, 403):
+            rp.disallow_all = True
+        elif 400 <= resp.status_code < 500:
+            rp.allow_all = True
+        else:
+            rp = None  # 5xx or unresolved redirect: retry after ROBOTS_FAIL_TTL
+    except (httpx.HTTPError, httpx.InvalidURL):
+        rp = None
+    _robots_cache[host] = (rp, now)
+    return rp
 
 
 def is_allowed(rp, user_agent: str, url: str) -> bool:
@@ -109,109 +257,467 @@ def is_allowed(rp, user_agent: str, url: str) -> bool:
         return True
 
 
-def setup_session(use_tor: bool, user_agent: str):
-    """Create a requests.Session with (or without) Tor."""
-    session = requests.Session()
-    session.headers.update({"User-Agent": user_agent})
-    if use_tor:
-        session.proxies.update({"http": TOR_PROXY, "https": TOR_PROXY})
-    return session
+def setup_client(use_tor: bool, user_agent: str, tor_port: int = DEFAULT_TOR_PORTS[0]) -> httpx.AsyncClient:
+    """Create a keep-alive httpx.AsyncClient with (or without) Tor on the given SOCKS port."""
+    transport = httpx.AsyncHTTPTransport(
+        proxy=TOR_PROXY.format(port=tor_port) if use_tor else None,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=50),
+    )
+    return httpx.AsyncClient(
+        headers={"User-Agent": user_agent, "Connection": "keep-alive"},
+        transport=transport,
+        timeout=30,
+        follow_redirects=True,
+        max_redirects=MAX_REDIRECTS,
+    )
+
+
+def parse_ports(value: str) -> list:
+    """Parse a comma-separated list of ports for --tor-ports/--control-ports."""
+    try:
+        ports = [int(p) for p in value.split(",") if p.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid port list: {value!r}")
+    if not ports or not all(1 <= p <= 65535 for p in ports):
+        raise argparse.ArgumentTypeError(f"invalid port list: {value!r}")
+    return ports
 
 
-def save_html(output_dir: str, url: str, content: bytes) -> str:
-    """Save HTML content to a file and return its path."""
-    parsed = urlparse(url)
-    safe_name = parsed.netloc + parsed.path.replace("/", "_")
-    if not safe_name or safe_name.endswith("_"):
-        safe_name += "index"
-    fname = f"{safe_name}.html"
-    path = os.path.join(output_dir, fname[:200])  # truncate long names
-    with open(path, "wb") as f:
-        f.write(content)
+def content_length(resp: httpx.Response) -> int:
+    """Declared Content-Length of a response, or 0 if missing/invalid."""
+    try:
+        return int(resp.headers.get("Content-Length", "0"))
+    except ValueError:
+        return 0
+
+
+class BodyTooLarge(Exception):
+    """Raised when a response body grows past the configured size cap."""
+
+
+async def save_html(output_dir: str, url: str, resp: httpx.Response, max_size: int = DEFAULT_MAX_SIZE) -> str:
+    """Stream an HTML response body (at most max_size bytes) to a file and return its path."""
+    # <output>/<h[:2]>/<sha1(url)>.html: collision-free, and shards keep directories small
+    h = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    subdir = os.path.join(output_dir, h[:2])
+    os.makedirs(subdir, exist_ok=True)
+    path = os.path.join(subdir, h + ".html")
+    # Disk I/O runs on the single writer thread so it never blocks the event loop
+    loop = asyncio.get_running_loop()
+    f = await loop.run_in_executor(_writer, open, path, "wb")
+    try:
+        received = 0
+        async for chunk in resp.aiter_bytes(STREAM_CHUNK_SIZE):
+            received += len(chunk)
+            if received > max_size:
+                raise BodyTooLarge(f"body exceeds {max_size} bytes")
+            await loop.run_in_executor(_writer, f.write, chunk)
+    except BaseException:
+        await loop.run_in_executor(_writer, f.close)
+        os.remove(path)  # don't leave truncated pages behind
+        raise
+    await loop.run_in_executor(_writer, f.close)
     return path
 
 
-def extract_links(base_url: str, html: str) -> set:
-    """Extract all valid <a href> links from HTML."""
-    soup = BeautifulSoup(html, "lxml")
+def get_charset(content_type: str):
+    """Return the charset declared in a Content-Type header, or None if missing/unknown."""
+    msg = Message()
+    msg["Content-Type"] = content_type
+    charset = msg.get_content_charset()
+    if not charset:
+        return None
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return None
+
+
+def parse_html(html: bytes, encoding: str = None):
+    """Parse HTML into an lxml document, or None if it can't be parsed."""
+    # Without an explicit encoding lxml only honours <meta charset> and falls back to Latin-1
+    parser = lxml.html.HTMLParser(encoding=encoding) if encoding else None
+    try:
+        return lxml.html.fromstring(html, parser=parser)
+    except (lxml.etree.ParserError, ValueError):
+        return None
+
+
+def extract_links(base_url: str, doc) -> set:
+    """Extract all valid <a href> links from a parsed HTML document."""
+    # Malformed hrefs (e.g. "http://[::1/x") are dropped instead of raising
+    doc.make_links_absolute(base_url, resolve_base_href=True, handle_failures="discard")
     links = set()
-    for a in soup.find_all("a", href=True):
-        href = a["href"].strip()
-        full_url = urljoin(base_url, href)
-        parsed = urlparse(full_url)
-        if parsed.scheme in ("http", "https"):
-            links.add(normalize_url(full_url))
+    for el, attr, href, _ in doc.iterlinks():
+        if attr != "href" or el.tag != "a":
+            continue
+        try:
+            parsed = urlparse(href)
+        except ValueError:
+            continue
+        if parsed.scheme not in _OK_SCHEMES or _SKIP_RE.search(parsed.path):
+            continue
+        link = normalize_url(href, parsed)
+        try:
+            httpx.URL(link)  # e.g. hosts that fail IDNA encoding can never be fetched
+        except httpx.InvalidURL:
+            continue
+        links.add(link)
     return links
 
 
-def log_to_csv(log_path: str, url: str, status, content_type="", saved_file=""):
-    """Append a record to the crawl log CSV."""
-    with open(log_path, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([url, status, content_type, saved_file])
+def simhash(text: str):
+    """64-bit SimHash over word 3-shingles of the text (None if there are no words)."""
+    words = _WORD_RE.findall(text.lower())
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))} if words else ()
+    if not shingles:
+        return None
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for i in range(64):
+            weights[i] += 1 if h >> i & 1 else -1
+    return sum(1 << i for i, w in enumerate(weights) if w > 0)
+
+
+def parse_saved(url: str, path: str, follow_links: bool, domain: str, encoding: str = None):
+    """Parse a saved page; return (in-scope links, simhash). Runs in a worker process."""
+    with open(path, "rb") as f:
+        doc = parse_html(f.read(), encoding)
+    if doc is None:
+        return [], None
+    sig = simhash(doc.text_content())
+    links = filter_in_scope(extract_links(url, doc), domain) if follow_links else []
+    return links, sig
+
+
+# === Deduplication ===
+
+class VisitedSet:
+    """Bloom-filter backed set of visited URLs with an exact set of recent ones."""
+
+    def __init__(self, recent_size: int = RECENT_URLS):
+        self.bloom = ScalableBloomFilter(initial_capacity=100000, error_rate=1e-6,
+                                         mode=ScalableBloomFilter.LARGE_SET_GROWTH)
+        self.recent = deque(maxlen=recent_size)
+        self.recent_set = set()
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.recent_set or url in self.bloom
+
+    def add(self, url: str):
+        if url in self.recent_set:
+            return
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_set.discard(self.recent[0])
+        self.recent.append(url)
+        self.recent_set.add(url)
+        self.bloom.add(url)
+
+
+class SimHashIndex:
+    """Near-duplicate lookup for 64-bit SimHashes, banded so lookups avoid a full scan."""
+
+    BANDS = 4  # distance <= SIMHASH_DISTANCE < BANDS guarantees one band matches exactly
+
+    def __init__(self, max_distance: int = SIMHASH_DISTANCE, on_add=None):
+        self.max_distance = max_distance
+        self.buckets = {}
+        self.on_add = on_add  # called with each newly accepted sig, e.g. to persist it
+
+    def _bands(self, sig: int):
+        width = 64 // self.BANDS
+        mask = (1 << width) - 1
+        return [(i, sig >> (i * width) & mask) for i in range(self.BANDS)]
+
+    def add_if_new(self, sig: int) -> bool:
+        """Record sig and return True, or return False if a near-duplicate is known."""
+        bands = self._bands(sig)
+        for band in bands:
+            for other in self.buckets.get(band, ()):
+                if bin(sig ^ other).count("1") <= self.max_distance:
+                    return False
+        self.add(sig)
+        if self.on_add:
+            self.on_add(sig)
+        return True
 
+    def add(self, sig: int):
+        """Record sig without checking for near-duplicates (e.g. when reloading saved state)."""
+        for band in self._bands(sig):
+            self.buckets.setdefault(band, []).append(sig)
 
-# === Main Crawler Logic ===
 
-def crawl(start_url, depth, delay, use_tor, output_dir, user_agent, respect_robots, max_pages):
-    """Main crawl loop (BFS)."""
-    start_url = normalize_url(start_url)
-    os.makedirs(output_dir, exist_ok=True)
-    log_path = os.path.join(output_dir, "crawl_log.csv")
+# === Crawl Log ===
 
-    # Initialize log file
-    if not os.path.exists(log_path):
-        with open(log_path, "w", newline="", encoding="utf-8") as f:
-            csv.writer(f).writerow(["url", "status_code", "content_type", "saved_file"])
+class CrawlLog:
+    """Append-only NDJSON crawl log, rolled over once it passes LOG_ROLL_SIZE."""
 
-    session = setup_session(use_tor, user_agent)
-    rp = load_robots_txt(start_url) if respect_robots else None
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, "crawl_log.ndjson")
+        self.f = open(self.path, "ab", buffering=LOG_BUFFER_SIZE)
 
-    visited = set()
-    queue = deque([(start_url, 0)])
-    processed = 0
+    def write(self, url: str, status, content_type="", saved_file=""):
+        self.f.write(orjson.dumps({"url": url, "status_code": status,
+                                   "content_type": content_type, "saved_file": saved_file}) + b"\n")
+        if self.f.tell() >= LOG_ROLL_SIZE:
+            self.roll()
 
-    logging.info(f"Starting crawl: {start_url} | Depth={depth} | TOR={'ON' if use_tor else 'OFF'}")
+    def roll(self):
+        self.f.close()
+        os.replace(self.path, self.path[:-len(".ndjson")] + time.strftime(".%Y%m%d-%H%M%S.ndjson"))
+        self.f = open(self.path, "ab", buffering=LOG_BUFFER_SIZE)
 
-    pbar = tqdm(total=max_pages, desc="Crawling", unit="page")
-    while queue and processed < max_pages:
-        url, level = queue.popleft()
-        if url in visited or level > depth:
-            continue
+    def close(self):
+        self.f.close()
 
-        # Robots.txt check
-        if respect_robots and not is_allowed(rp, user_agent, url):
-            logging.info(f"Blocked by robots.txt: {url}")
-            log_to_csv(log_path, url, "robots_blocked")
-            visited.add(url)
-            pbar.update(1)
-            continue
 
+# === Crawl State (resume support) ===
+
+class CrawlState:
+    """SQLite-backed visited set and frontier so an interrupted crawl can resume."""
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS queue (url TEXT PRIMARY KEY, depth INTEGER)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS sigs (sig INTEGER)")
+        self.db.commit()
+        self.pending = 0
+
+    def claim_seed(self, start_url: str):
+        """Record start_url as this state's seed; return the seed it already had, if any."""
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'start_url'").fetchone()
+        if row is not None:
+            return row[0]
+        self.db.execute("INSERT INTO meta (key, value) VALUES ('start_url', ?)", (start_url,))
+        self.db.commit()
+        return None
+
+    def visited_urls(self):
+        return (row[0] for row in self.db.execute("SELECT url FROM visited"))
+
+    def signatures(self):
+        # SQLite integers are signed 64-bit, so SimHashes are stored in two's complement
+        return (row[0] & (1 << 64) - 1 for row in self.db.execute("SELECT sig FROM sigs"))
+
+    def add_sig(self, sig: int):
+        self.db.execute("INSERT INTO sigs (sig) VALUES (?)", (sig - (1 << 64) if sig >= 1 << 63 else sig,))
+
+    def queued(self) -> dict:
+        """Return the saved frontier as {depth: [urls]}."""
+        levels = {}
+        for url, depth in self.db.execute("SELECT url, depth FROM queue"):
+            levels.setdefault(depth, []).append(url)
+        return levels
+
+    def enqueue(self, urls, depth: int):
+        self.db.executemany("INSERT OR IGNORE INTO queue (url, depth) VALUES (?, ?)",
+                            ((url, depth) for url in urls))
+
+    def mark_done(self, url: str):
+        self.db.execute("INSERT OR IGNORE INTO visited (url) VALUES (?)", (url,))
+        self.db.execute("DELETE FROM queue WHERE url = ?", (url,))
+        self.pending += 1
+        if self.pending >= CHECKPOINT_EVERY:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+# === Main Crawler Logic ===
+
+class HostLimiter:
+    """Per-host politeness: at most one request per host every `delay` seconds."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.next = {}
+
+    async def wait(self, host: str):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self.next.get(host, 0))
+        self.next[host] = slot + self.delay  # reserve before sleeping
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def fetch(client, sem, limiter, rotator, url: str, output_dir: str, max_size: int = DEFAULT_MAX_SIZE):
+    """Fetch a URL (following redirects), streaming HTML to disk.
+
+    Returns (url, status, content_type, saved_file, final_url).
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(MAX_RETRIES + 1):
+        # Every attempt, retries included, takes its own per-host slot
+        await limiter.wait(get_domain(url))
+        failed = slow = False
         try:
-            resp = session.get(url, timeout=30)
-            status = resp.status_code
-            ctype = resp.headers.get("Content-Type", "")
-            saved_file = ""
-
-            if status == 200 and "text/html" in ctype.lower():
-                saved_file = save_html(output_dir, url, resp.content)
-                if level < depth:
-                    links = extract_links(url, resp.text)
-                    for link in links:
-                        if link not in visited and get_domain(link).endswith(get_domain(start_url)):
-                            queue.append((link, level + 1))
-
-            log_to_csv(log_path, url, status, ctype, saved_file)
-        except RequestException as e:
-            logging.warning(f"Error fetching {url}: {e}")
-            log_to_csv(log_path, url, f"error:{type(e).__name__}")
+            async with sem:
+                try:
+                    started = loop.time()
+                    async with client.stream("GET", url) as resp:
+                        slow = loop.time() - started > SLOW_RESPONSE
+                        status = resp.status_code
+                        ctype = resp.headers.get("Content-Type", "")
+                        final_url = str(resp.url)
+                        if status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                            saved_file = ""
+                            if status == 200 and "text/html" in ctype.lower():
+                                if content_length(resp) > max_size:
+                                    logging.info(f"Skipping oversized page: {url}")
+                                    return url, "too_large", ctype, "", final_url
+                                try:
+                                    saved_file = await save_html(output_dir, url, resp, max_size)
+                                except BodyTooLarge:
+                                    logging.info(f"Aborted oversized page: {url}")
+                                    return url, "too_large", ctype, "", final_url
+                            return url, status, ctype, saved_file, final_url
+                except httpx.InvalidURL as e:
+                    logging.warning(f"Error fetching {url}: {e}")
+                    return url, f"error:{type(e).__name__}", "", "", url  # retrying won't help
+                except httpx.HTTPError as e:
+                    logging.warning(f"Error fetching {url}: {e}")
+                    if attempt == MAX_RETRIES:
+                        return url, f"error:{type(e).__name__}", "", "", url
+                    failed = True
+        finally:
+            # Rotate with the concurrency slot released (returns from inside the block land here too)
+            if (failed or slow) and rotator:
+                await rotator.renew()
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+
+async def crawl_page(client, rotator, sem, limiter, pool, sigs, url: str, output_dir: str, follow_links: bool, domain: str,
+                     max_size: int = DEFAULT_MAX_SIZE):
+    """Fetch a URL, then parse the saved page off the event loop and drop near-duplicates."""
+    url, status, ctype, saved_file, final_url = await fetch(client, sem, limiter, rotator, url, output_dir, max_size)
+    links = []
+    if saved_file:
+        # Resolve links and check scope against where the redirects actually landed
+        follow_links = follow_links and in_scope(get_domain(final_url), domain)
+        loop = asyncio.get_running_loop()
+        links, sig = await loop.run_in_executor(pool, parse_saved, final_url, saved_file, follow_links, domain,
+                                                get_charset(ctype))
+        if sig is not None and not sigs.add_if_new(sig):
+            logging.info(f"Near-duplicate content: {url}")
+            os.remove(saved_file)
+            return url, "near_duplicate", ctype, "", [], final_url
+    return url, status, ctype, saved_file, links, final_url
+
+
+async def crawl(start_url, depth, delay, use_tor, output_dir, user_agent, respect_robots, max_pages,
+                tor_ports=DEFAULT_TOR_PORTS, control_ports=None, max_size=DEFAULT_MAX_SIZE):
+    """Main crawl loop (level-by-level BFS with concurrent fetches)."""
+    start_url = normalize_url(start_url)
+    start_domain = get_domain(start_url)
+    os.makedirs(output_dir, exist_ok=True)
 
+    # Only resume a saved frontier that was seeded from this same start URL
+    state_path = os.path.join(output_dir, "state.db")
+    state = CrawlState(state_path)
+    saved_seed = state.claim_seed(start_url)
+    if saved_seed is not None and saved_seed != start_url:
+        state.close()
+        sys.exit(f"[-] {state_path} belongs to a crawl of {saved_seed}, not {start_url}. "
+                 f"Re-run with -u {saved_seed} to resume it, or use another --output to start fresh.")
+    log = CrawlLog(output_dir)
+    visited = VisitedSet()
+    for url in state.visited_urls():
         visited.add(url)
-        processed += 1
-        pbar.update(1)
-        time.sleep(delay)
+    levels = state.queued()
+    if levels:
+        logging.info(f"Resuming crawl: {sum(map(len, levels.values()))} queued URLs")
+    else:
+        levels = {0: [start_url]}
+        state.enqueue([start_url], 0)
+    sigs = SimHashIndex(on_add=state.add_sig)
+    for sig in state.signatures():
+        sigs.add(sig)
+    processed = 0
+    sem = asyncio.Semaphore(DEFAULT_CONCURRENCY)
+    limiter = HostLimiter(delay)
+    pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+    logging.info(f"Starting crawl: {start_url} | Depth={depth} | TOR={'ON' if use_tor else 'OFF'}"
+                 + (f" | Circuits={len(tor_ports)}" if use_tor else ""))
+
+    pbar = tqdm(total=max_pages, desc="Crawling", unit="page")
+    try:
+        async with AsyncExitStack() as stack:
+            # One client per Tor instance, paired with that instance's ControlPort, used round-robin
+            if use_tor:
+                if control_ports is None:
+                    control_ports = [port + 1 for port in tor_ports]  # Tor's 9050/9051 convention
+                circuit_list = [(await stack.enter_async_context(setup_client(use_tor, user_agent, port)),
+                                 CircuitRotator(control_port))
+                                for port, control_port in zip(tor_ports, control_ports)]
+            else:
+                circuit_list = [(await stack.enter_async_context(setup_client(use_tor, user_agent)), None)]
+            circuits = itertools.cycle(circuit_list)
+            for level in range(depth + 1):
+                batch = []
+                for url in levels.pop(level, []):
+                    if url in visited or processed + len(batch) >= max_pages:
+                        continue
+                    visited.add(url)
+
+                    # Skip obvious binaries without spending a request on them
+                    if not looks_like_html(url):
+                        log.write(url, "skipped_non_html")
+                        state.mark_done(url)
+                        pbar.update(1)
+                        continue
+
+                    # Robots.txt check
+                    if respect_robots and not is_allowed(await get_rp(next(circuits)[0], url), user_agent, url):
+                        logging.info(f"Blocked by robots.txt: {url}")
+                        log.write(url, "robots_blocked")
+                        state.mark_done(url)
+                        pbar.update(1)
+                        continue
+                    batch.append(url)
+
+                if not batch:
+                    continue
+
+                results = await asyncio.gather(*(
+                    crawl_page(*next(circuits), sem, limiter, pool, sigs, url, output_dir, level < depth,
+                               start_domain, max_size)
+                    for url in batch))
+
+                next_level = levels.setdefault(level + 1, [])
+                for url, status, ctype, saved_file, links, final_url in results:
+                    if final_url != url:
+                        # Don't fetch the redirect target again when it is linked directly
+                        final_url = normalize_url(final_url)
+                        visited.add(final_url)
+                        state.mark_done(final_url)
+                    # Links arrive scope-filtered from the worker; only the visited check runs here
+                    new_links = [link for link in links if link not in visited]
+                    next_level.extend(new_links)
+                    state.enqueue(new_links, level + 1)
+
+                    log.write(url, status, ctype, saved_file)
+                    state.mark_done(url)
+                    processed += 1
+                    pbar.update(1)
+
+                if processed >= max_pages:
+                    break
+    finally:
+        state.close()
+        pool.shutdown()
+        pbar.close()
+        log.close()
 
-    pbar.close()
     logging.info("Crawl complete.")
 
 
@@ -221,14 +727,23 @@ def main():
     parser = argparse.ArgumentParser(description="Functional Tor-enabled web crawler")
     parser.add_argument("-u", "--url", required=True, help="Start URL (http(s) or .onion)")
     parser.add_argument("-d", "--depth", type=int, default=1, help="Crawl depth")
-    parser.add_argument("-p", "--delay", type=float, default=DEFAULT_DELAY, help="Delay between requests (sec)")
+    parser.add_argument("-p", "--delay", type=float, default=DEFAULT_DELAY, help="Delay between requests to the same host (sec)")
     parser.add_argument("--no-tor", action="store_true", help="Disable TOR (use direct requests)")
+    parser.add_argument("--tor-ports", type=parse_ports, default=DEFAULT_TOR_PORTS,
+                        help="Comma-separated Tor SOCKS ports to round-robin across (e.g. 9050,9052,9054)")
+    parser.add_argument("--control-ports", type=parse_ports, default=None,
+                        help="Comma-separated Tor ControlPorts, one per --tor-ports entry, used to request "
+                             "new circuits on slow/failed requests (default: each SOCKS port + 1)")
     parser.add_argument("--no-robots", action="store_true", help="Ignore robots.txt")
     parser.add_argument("--user-agent", default=DEFAULT_USER_AGENT, help="User-Agent string")
     parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES, help="Maximum pages to crawl")
+    parser.add_argument("--max-size", type=float, default=DEFAULT_MAX_SIZE / (1024 * 1024),
+                        help="Maximum page size to download (MB)")
     parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_DIR, help="Output directory")
 
     args = parser.parse_args()
+    if args.control_ports is not None and len(args.control_ports) != len(args.tor_ports):
+        parser.error("--control-ports must list one port per --tor-ports entry")
 
     # --- Tor checks ---
     if not args.no_tor:
@@ -238,7 +753,7 @@ def main():
             start_tor_service()
 
     # --- Start crawl ---
-    crawl(
+    asyncio.run(crawl(
         start_url=args.url,
         depth=args.depth,
         delay=args.delay,
@@ -246,8 +761,11 @@ def main():
         output_dir=args.output,
         user_agent=args.user_agent,
         respect_robots=not args.no_robots,
-        max_pages=args.max_pages
-    )
+        max_pages=args.max_pages,
+        tor_ports=args.tor_ports,
+        control_ports=args.control_ports,
+        max_size=int(args.max_size * 1024 * 1024)
+    ))
 
 
 if __name__ == "__main__":